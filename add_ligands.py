@@ -3,24 +3,62 @@
 add_ligands.py
 ---------------
 Combine multiple ligand files (SDF/MOL/MOL2/PDB or PDB IDs)
-into a single multi-ligand SDF file with hydrogens and 3D coordinates.
+into a single multi-ligand SDF file with hydrogens and 3D coordinates,
+or convert them straight to one PDBQT per ligand with --pdbqt.
 
 Usage:
     python3 add_ligands.py output.sdf ligand1.sdf ligand2.sdf ...
+    python3 add_ligands.py --pdbqt pdbqt_folder/ ligand1.sdf ligand2.sdf ...
 """
 
 import os
-import sys
-from rdkit import Chem
+import argparse
+import concurrent.futures
+import functools
+import hashlib
+import multiprocessing
+import subprocess
+from rdkit import Chem, rdBase
 from rdkit.Chem import AllChem
 import requests
+from requests.adapters import HTTPAdapter
 from io import StringIO
+from convert_to_pdbqt import mol_iter, prepare_and_write_pdbqt, safe_filename
+
+# Prepared ligands are cached here, keyed by canonical isomeric SMILES
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "docking_pipeline")
+
+# RDKit threads used per ligand for conformer embedding and MMFF (0 = all
+# cores). The outer process pool is sized so the two levels share the CPUs.
+EMBED_THREADS = 4
+
+# RDKit embedding timeout (seconds). It applies to the whole embedding call
+# for a molecule fragment, which returns [-1] when it fires.
+EMBED_BUDGET = 30
+
+EMBED_SEED = 42
+
+# MMFF iteration cap; RDKit's default of 200 leaves drug-sized ligands
+# unconverged
+MMFF_MAX_ITERS = 2000
+
+# Bump when prepare_mol changes in a way the constants above don't capture,
+# so stale cache entries are no longer matched
+PREP_VERSION = 1
+
+# Molecules are pickled with all their properties so SD data fields survive
+# the trip through the worker pool and the cache
+PICKLE_PROPS = Chem.PropertyPickleOptions.AllProps
+
+# Shared HTTP session so repeated RCSB fetches reuse pooled connections
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
 
 def fetch_from_pdb(ligand_id):
     """Fetch a ligand from RCSB by its three-letter PDB ID."""
     url = f"https://files.rcsb.org/ligands/view/{ligand_id.upper()}_model.sdf"
     print(f"📥 Fetching ligand {ligand_id.upper()} from RCSB...")
-    r = requests.get(url)
+    r = _session.get(url)
     if r.status_code != 200:
         print(f"⚠️  Could not fetch {ligand_id.upper()} from RCSB (HTTP {r.status_code}).")
         return None
@@ -29,41 +67,176 @@ def fetch_from_pdb(ligand_id):
     return mols
 
 def read_ligand_file(path):
-    """Read a ligand file in SDF/MOL/MOL2/PDB format."""
+    """Yield the molecules in a ligand file in SDF/MOL/MOL2/PDB format."""
     ext = os.path.splitext(path)[1].lower()
-    mols = []
     try:
         if ext == ".sdf":
-            suppl = Chem.SDMolSupplier(path)
-            mols = [m for m in suppl if m is not None]
+            yield from mol_iter(path)
         elif ext in (".mol", ".mol2", ".pdb"):
             m = Chem.MolFromMolFile(path, removeHs=False)
             if m:
-                mols = [m]
+                yield m
         else:
             print(f"⚠️  Unsupported format for {path}. Skipping.")
     except Exception as e:
         print(f"⚠️  Error reading {path}: {e}")
-    return mols
 
-def prepare_mol(mol):
-    """Add hydrogens and generate 3D coordinates."""
+def prep_tag(num_confs):
+    """Describe the preparation protocol; folded into every cache key."""
+    return (
+        f"v{PREP_VERSION}|rdkit-{rdBase.rdkitVersion}|ETKDGv3|seed={EMBED_SEED}"
+        f"|budget={EMBED_BUDGET}|confs={num_confs}|retry=randomcoords,nochirality|MMFF94s|maxIters={MMFF_MAX_ITERS}"
+    )
+
+def prepare_mol(mol, num_confs=10, use_cache=True):
+    """Add hydrogens and generate 3D coordinates.
+
+    Embeds several conformers, MMFF-optimizes them in one batch call and
+    keeps only the lowest-energy one. Results are cached on disk so
+    re-runs skip embedding for ligands that were already prepared.
+    """
+    smiles = Chem.MolToSmiles(Chem.RemoveHs(mol), isomericSmiles=True)
+    key = hashlib.blake2b(f"{smiles}|{prep_tag(num_confs)}".encode()).hexdigest()[:16]
+    cache_path = os.path.join(CACHE_DIR, f"{key}.mol.bin")
+    if use_cache and os.path.exists(cache_path):
+        try:
+            with open(cache_path, "rb") as f:
+                cached = Chem.Mol(f.read())
+            # Reuse the cached geometry but keep this input's name and SD fields
+            for prop in cached.GetPropNames():
+                cached.ClearProp(prop)
+            for prop in list(mol.GetPropNames()) + ["_Name"]:
+                if mol.HasProp(prop):
+                    cached.SetProp(prop, mol.GetProp(prop))
+            return cached
+        except Exception as e:
+            # Truncated entry or one written by an incompatible RDKit:
+            # drop it and prepare the molecule from scratch
+            print(f"⚠️  Ignoring unreadable cache entry {cache_path}: {e}")
+            try:
+                os.remove(cache_path)
+            except OSError:
+                pass
+
+    name = mol.GetProp("_Name") if mol.HasProp("_Name") else "ligand"
     mol = Chem.AddHs(mol)
     try:
-        AllChem.EmbedMolecule(mol, randomSeed=42)
-        AllChem.MMFFOptimizeMolecule(mol)
+        # ETKDGv3 with a wall-clock cap so one pathological ligand
+        # (macrocycle, peptide) can't stall the whole run: each pass is
+        # capped at EMBED_BUDGET per fragment.
+        ps = AllChem.ETKDGv3()
+        ps.randomSeed = EMBED_SEED
+        ps.timeout = EMBED_BUDGET
+        ps.useRandomCoords = False
+        ps.numThreads = EMBED_THREADS
+        # A timed-out embedding comes back as [-1], so keep real ids only
+        cids = [c for c in AllChem.EmbedMultipleConfs(mol, numConfs=num_confs, params=ps) if c >= 0]
+        if not cids:
+            # Retry a single conformer from random coordinates with
+            # relaxed chirality
+            ps.useRandomCoords = True
+            ps.enforceChirality = False
+            cids = [c for c in AllChem.EmbedMultipleConfs(mol, numConfs=1, params=ps) if c >= 0]
+        if not cids:
+            print(f"⚠️  3D embedding failed for {name}; skipping MMFF optimization.")
+            return mol
+
+        # Force-field setup is done once for all conformers. Each result is
+        # (status, energy): 0 converged, 1 not converged, -1 setup failed.
+        results = AllChem.MMFFOptimizeMoleculeConfs(
+            mol, numThreads=EMBED_THREADS, maxIters=MMFF_MAX_ITERS, mmffVariant="MMFF94s"
+        )
+        usable = [i for i, (status, _) in enumerate(results) if status != -1]
+        if not usable:
+            print(f"⚠️  MMFF94s parameters missing for {name}; keeping an unoptimized conformer.")
+            best = Chem.Conformer(mol.GetConformer(cids[0]))
+            mol.RemoveAllConformers()
+            mol.AddConformer(best, assignId=True)
+            return mol
+        not_converged = sum(1 for i in usable if results[i][0] == 1)
+        if not_converged:
+            print(f"⚠️  MMFF did not converge for {not_converged}/{len(usable)} conformers of {name}.")
+
+        best_idx = min(usable, key=lambda i: results[i][1])
+        best = Chem.Conformer(mol.GetConformer(cids[best_idx]))
+        mol.RemoveAllConformers()
+        mol.AddConformer(best, assignId=True)
     except Exception as e:
         print(f"⚠️  3D generation failed: {e}")
+        return mol
+
+    if use_cache:
+        # Write via a temp file so concurrent workers never see a partial entry
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(mol.ToBinary(PICKLE_PROPS))
+            os.replace(tmp, cache_path)
+        except OSError as e:
+            print(f"⚠️  Could not write cache entry {cache_path}: {e}")
     return mol
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage: python3 add_ligands.py output.sdf ligand1.sdf ligand2.sdf ...")
-        sys.exit(1)
+def prepare_mol_worker(job, use_cache=True):
+    """Pool worker: prepare one pickled molecule and return it pickled."""
+    name, buf = job
+    mol = Chem.Mol(buf)
+    mol.SetProp("_Name", name)
+    mol = prepare_mol(mol, use_cache=use_cache)
+    return name, mol.ToBinary(PICKLE_PROPS)
+
+def prepare_pdbqt_worker(job, out_dir, use_cache=True):
+    """Pool worker: prepare one pickled molecule and write it out as PDBQT."""
+    name, buf = job
+    mol = Chem.Mol(buf)
+    mol.SetProp("_Name", name)
+    mol = prepare_mol(mol, use_cache=use_cache)
+    mol.SetProp("_Name", name)
+    try:
+        return prepare_and_write_pdbqt(mol, out_dir)
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️  Conversion failed for {name}:\n{e.stderr}")
+        return None
+
+def is_pdb_id(src):
+    """True if a ligand source looks like a three-letter PDB ligand ID."""
+    return len(src) == 3 and src.isalpha()
 
-    out_sdf = sys.argv[1]
-    ligand_sources = sys.argv[2:]
+def iter_jobs(ligand_sources):
+    """Yield (name, pickled mol) pairs for every molecule in the sources.
 
+    Names come from the source file name (or PDB ID). Repeats, such as the
+    records of a multi-molecule SDF, get a _2, _3, ... suffix so every
+    molecule maps to its own output file.
+    """
+    # Fetch all PDB IDs up front, concurrently, over the shared session
+    pdb_ids = [src for src in ligand_sources if is_pdb_id(src)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as ex:
+        fetched = dict(zip(pdb_ids, ex.map(fetch_from_pdb, pdb_ids)))
+
+    used = set()
+    for src in ligand_sources:
+        if is_pdb_id(src):
+            mols = fetched[src] or []
+        else:
+            mols = read_ligand_file(src)
+
+        base = os.path.splitext(os.path.basename(src))[0]
+        count = 0
+        for mol in mols:
+            count += 1
+            name, n = base, 1
+            while safe_filename(name) in used:
+                n += 1
+                name = f"{base}_{n}"
+            used.add(safe_filename(name))
+            yield name, mol.ToBinary(PICKLE_PROPS)
+
+        if not count:
+            print(f"⚠️  No valid molecules found in {src}")
+
+def write_sdf(pool, jobs, out_sdf, use_cache=True):
+    """Write prepared molecules to a combined SDF; returns the count written."""
     # Create the output file if it doesn't exist
     if not os.path.exists(out_sdf):
         print(f"🪄 Creating new output file: {out_sdf}")
@@ -71,27 +244,51 @@ def main():
 
     writer = Chem.SDWriter(out_sdf)
     total = 0
+    worker = functools.partial(prepare_mol_worker, use_cache=use_cache)
+    for name, buf in pool.imap(worker, jobs, chunksize=4):
+        mol = Chem.Mol(buf)
+        mol.SetProp("_Name", name)
+        writer.write(mol)
+        total += 1
+    writer.close()
+    return total
 
-    for src in ligand_sources:
-        if len(src) == 3 and src.isalpha():
-            mols = fetch_from_pdb(src)
-        else:
-            mols = read_ligand_file(src)
+def write_pdbqt(pool, jobs, out_dir, use_cache=True):
+    """Convert prepared molecules to PDBQT in the workers; returns the number of files written."""
+    os.makedirs(out_dir, exist_ok=True)
+    worker = functools.partial(prepare_pdbqt_worker, out_dir=out_dir, use_cache=use_cache)
+    written = {path for path in pool.imap(worker, jobs, chunksize=4) if path}
+    return len(written)
 
-        if not mols:
-            print(f"⚠️  No valid molecules found in {src}")
-            continue
+def main():
+    ap = argparse.ArgumentParser(
+        description="Prepare ligands with hydrogens and 3D coordinates as a combined SDF or per-ligand PDBQT files."
+    )
+    ap.add_argument("output", help="Output SDF file (output folder with --pdbqt)")
+    ap.add_argument("ligands", nargs="+", help="Ligand files (SDF/MOL/MOL2/PDB) or three-letter PDB IDs")
+    ap.add_argument("--pdbqt", action="store_true",
+                    help="Write one PDBQT per ligand via Open Babel instead of a combined SDF")
+    ap.add_argument("--no-cache", action="store_true",
+                    help=f"Neither read nor write prepared ligands in {CACHE_DIR}")
+    args = ap.parse_args()
 
-        for mol in mols:
-            mol = prepare_mol(mol)
-            name = os.path.splitext(os.path.basename(src))[0]
-            mol.SetProp("_Name", name)
-            writer.write(mol)
-            total += 1
+    # Embedding is CPU-bound and independent per ligand, so fan it out over
+    # a process pool; each worker also runs EMBED_THREADS RDKit threads.
+    # Molecules cross the process boundary as RDKit binary pickles; results
+    # come back in input order.
+    cpus = os.cpu_count() or 1
+    workers = 1 if EMBED_THREADS == 0 else max(1, cpus // EMBED_THREADS)
+    jobs = iter_jobs(args.ligands)
+    with multiprocessing.Pool(workers) as pool:
+        if args.pdbqt:
+            total = write_pdbqt(pool, jobs, args.output, use_cache=not args.no_cache)
+        else:
+            total = write_sdf(pool, jobs, args.output, use_cache=not args.no_cache)
 
-    writer.close()
-    print(f"\n✅ Combined {total} ligands into {out_sdf}")
+    if args.pdbqt:
+        print(f"\n✅ Wrote {total} ligands as PDBQT to '{args.output}'")
+    else:
+        print(f"\n✅ Combined {total} ligands into {args.output}")
 
 if __name__ == "__main__":
     main()
-
@@ -17,8 +17,37 @@ Example:
 import os
 import sys
 import subprocess
+import tempfile
 from rdkit import Chem
 
+def mol_iter(path):
+    """Lazily yield the molecules RDKit can parse from an SDF file."""
+    for mol in Chem.SDMolSupplier(path):
+        if mol is not None:
+            yield mol
+
+def safe_filename(name):
+    """Replace characters that are awkward in file names with underscores."""
+    return "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in name)
+
+def prepare_and_write_pdbqt(mol, out_dir):
+    """Convert an in-memory molecule to <out_dir>/<name>.pdbqt.
+
+    The MolBlock is piped to Open Babel over stdin, so no intermediate
+    SDF is written. Open Babel writes into a scratch directory and the
+    result is moved into place, so readers never see a partial PDBQT. Raises
+    CalledProcessError if the conversion fails.
+    """
+    name = mol.GetProp("_Name") if mol.HasProp("_Name") else "ligand"
+    pdbqt_path = os.path.join(out_dir, f"{safe_filename(name)}.pdbqt")
+    # obabel creates a fresh file, so permissions follow the umask
+    with tempfile.TemporaryDirectory(prefix=".", dir=out_dir) as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, "ligand.pdbqt")
+        cmd = ["obabel", "-isdf", "-opdbqt", "-O", tmp_path]
+        subprocess.run(cmd, input=Chem.MolToMolBlock(mol), capture_output=True, text=True, check=True)
+        os.replace(tmp_path, pdbqt_path)
+    return pdbqt_path
+
 def main():
     if len(sys.argv) < 3:
         print("Usage: python convert_to_pdbqt.py input.sdf output_folder/")
@@ -33,36 +62,36 @@ def main():
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # Count and split ligands using RDKit
-    suppl = Chem.SDMolSupplier(input_sdf)
-    mols = [m for m in suppl if m is not None]
-
-    print(f"✅ Found {len(mols)} molecules in {input_sdf}")
-    sdf_list = []
-
-    for i, mol in enumerate(mols, start=1):
-        name = mol.GetProp("_Name") if mol.HasProp("_Name") else f"ligand_{i}"
-        safe_name = "".join(c if c.isalnum() or c in ("_", "-") else "_" for c in name)
-        sdf_file = os.path.join(output_dir, f"{safe_name}.sdf")
-        pdbqt_file = os.path.join(output_dir, f"{safe_name}.pdbqt")
-        sdf_list.append((sdf_file, pdbqt_file))
-
-        # Write each ligand to its own SDF
-        writer = Chem.SDWriter(sdf_file)
-        writer.write(mol)
+    converted = 0
+    with tempfile.TemporaryDirectory(dir=output_dir) as tmp_dir:
+        # Stream the records RDKit can read into a scratch SDF, keeping only
+        # their names, so that Open Babel's numbering lines up with `names`
+        tmp_sdf = os.path.join(tmp_dir, "input.sdf")
+        writer = Chem.SDWriter(tmp_sdf)
+        names = []
+        for i, mol in enumerate(mol_iter(input_sdf), start=1):
+            name = mol.GetProp("_Name") if mol.HasProp("_Name") else f"ligand_{i}"
+            names.append(safe_filename(name))
+            writer.write(mol)
         writer.close()
 
-    print(f"🧩 Split into {len(sdf_list)} individual SDF files.")
+        print(f"✅ Found {len(names)} molecules in {input_sdf}")
 
-    # Convert each SDF → PDBQT using Open Babel
-    converted = 0
-    for sdf_file, pdbqt_file in sdf_list:
-        cmd = ["obabel", sdf_file, "-O", pdbqt_file]
+        # Convert every record in a single Open Babel process: "-m" writes
+        # lig_1.pdbqt, lig_2.pdbqt, ... in record order
+        cmd = ["obabel", tmp_sdf, "-O", os.path.join(tmp_dir, "lig_.pdbqt"), "-m"]
         result = subprocess.run(cmd, capture_output=True, text=True)
-        if result.returncode == 0:
-            converted += 1
-        else:
-            print(f"⚠️  Conversion failed for {sdf_file}:\n{result.stderr}")
+        if result.returncode != 0:
+            print(f"❌ Open Babel conversion failed:\n{result.stderr}")
+            sys.exit(1)
+
+        for i, safe_name in enumerate(names, start=1):
+            split_file = os.path.join(tmp_dir, f"lig_{i}.pdbqt")
+            if os.path.exists(split_file):
+                os.replace(split_file, os.path.join(output_dir, f"{safe_name}.pdbqt"))
+                converted += 1
+            else:
+                print(f"⚠️  Conversion failed for {safe_name}")
 
     print(f"✨ Successfully converted {converted} ligands to PDBQT in '{output_dir}'")
 
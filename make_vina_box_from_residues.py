@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 import os, sys, argparse
-from statistics import mean
+import numpy as np
 
 def parse_residue_list(reslist):
     residues = []
@@ -15,28 +15,61 @@ def parse_residue_list(reslist):
             sys.exit(f"❌ Invalid residue specifier: {item}. Use format Chain:Resid")
     return residues
 
-def get_residue_coords(pdbfile, residues):
-    xs, ys, zs = [], [], []
-    targets = set(residues)
-    with open(pdbfile, "r") as f:
-        for line in f:
-            if not line.startswith(("ATOM", "HETATM")):
-                continue
-            chain = line[21].strip()
+# Fixed-width PDB/PDBQT helpers, shared with run_pipeline.py. Records are
+# padded to at least RECORD_WIDTH columns and never truncated.
+RECORD_WIDTH = 80
+
+def fixed_width_records(lines):
+    """Return byte lines as one fixed-width bytes array (at least RECORD_WIDTH wide)."""
+    recs = np.array(lines or [b""])
+    if recs.dtype.itemsize < RECORD_WIDTH:
+        recs = recs.astype(f"S{RECORD_WIDTH}")
+    return recs
+
+def record_columns(recs):
+    """View fixed-width records as an (N, width) array of single-byte columns."""
+    return recs.view("S1").reshape(-1, recs.dtype.itemsize)
+
+def column_field(cols, start, end, width=None):
+    """Join columns [start:end) into byte strings, split into `width`-sized fields."""
+    return np.ascontiguousarray(cols[:, start:end]).view(f"S{width or end - start}")
+
+def to_float(field):
+    """Convert a bytes array to floats, mapping unparseable entries to NaN."""
+    try:
+        return field.astype(float)
+    except ValueError:
+        out = np.empty(field.shape)
+        for idx, val in np.ndenumerate(field):
             try:
-                resid = int(line[22:26])
+                out[idx] = float(val)
             except ValueError:
-                continue
-            if (chain, resid) in targets:
-                try:
-                    xs.append(float(line[30:38]))
-                    ys.append(float(line[38:46]))
-                    zs.append(float(line[46:54]))
-                except ValueError:
-                    pass
-    if not xs:
+                out[idx] = np.nan
+        return out
+
+def read_atom_records(pdbfile):
+    """Return ATOM/HETATM records as an (N, width) array of single-byte columns."""
+    with open(pdbfile, "rb") as f:
+        recs = fixed_width_records(f.read().splitlines())
+    is_atom = np.char.startswith(recs, b"ATOM") | np.char.startswith(recs, b"HETATM")
+    return record_columns(recs[is_atom])
+
+def get_residue_coords(pdbfile, residues):
+    # PDB records are fixed-width, so slice the columns for every atom at once
+    cols = read_atom_records(pdbfile)
+    chains = np.char.strip(cols[:, 21])
+    resids = to_float(column_field(cols, 22, 26).ravel())
+    xyz = to_float(column_field(cols, 30, 54, width=8))
+
+    mask = np.zeros(len(cols), dtype=bool)
+    for chain, resid in set(residues):
+        mask |= (chains == chain.encode()) & (resids == resid)
+    xyz = xyz[mask]
+    xyz = xyz[~np.isnan(xyz).any(axis=1)]
+
+    if not len(xyz):
         sys.exit("❌ No matching residues found in receptor file.")
-    return xs, ys, zs
+    return xyz
 
 def main():
     ap = argparse.ArgumentParser()
@@ -50,14 +83,11 @@ def main():
         sys.exit(f"❌ Receptor file not found: {args.receptor}")
 
     residues = parse_residue_list(args.residues)
-    xs, ys, zs = get_residue_coords(args.receptor, residues)
-
-    xmin, xmax = min(xs), max(xs)
-    ymin, ymax = min(ys), max(ys)
-    zmin, zmax = min(zs), max(zs)
+    xyz = get_residue_coords(args.receptor, residues)
 
-    cx, cy, cz = mean([xmin, xmax]), mean([ymin, ymax]), mean([zmin, zmax])
-    sx, sy, sz = (xmax - xmin) + 2*args.padding, (ymax - ymin) + 2*args.padding, (zmax - zmin) + 2*args.padding
+    mn, mx = xyz.min(axis=0), xyz.max(axis=0)
+    cx, cy, cz = (mn + mx) / 2
+    sx, sy, sz = (mx - mn) + 2*args.padding
 
     with open(args.out, "w") as f:
         f.write(f"receptor = {args.receptor}\n")
@@ -16,10 +16,11 @@ def main(receptor, results_dir="results/", top_n=5):
         print(f"❌ No binding_scores.csv found in {results_dir}")
         sys.exit(1)
 
-    # Read and sort binding scores
-    with open(csv_path, "r") as f:
-        reader = csv.DictReader(f)
-        rows = sorted(reader, key=lambda r: float(r["Best ΔG (kcal/mol)"]))
+    # Read and sort binding scores (columns: Ligand, Best ΔG (kcal/mol))
+    with open(csv_path, "r", newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        rows = sorted(((r[0], float(r[1])) for r in reader if r), key=lambda r: r[1])
 
     top_rows = rows[:top_n]
 
@@ -27,10 +28,9 @@ def main(receptor, results_dir="results/", top_n=5):
     cxc_path = os.path.join(results_dir, "view_top_ligands.cxc")
     with open(cxc_path, "w") as cxc:
         cxc.write(f"open {receptor}\n")
-        for row in top_rows:
-            ligand_name = row["Ligand"]
+        for ligand_name, _ in top_rows:
             pdbqt_file = os.path.join(results_dir, f"{ligand_name}_out.pdbqt")
-            if os.path.exists(pdbqt_file):
+            if os.path.isfile(pdbqt_file):
                 dest = os.path.join(top_dir, f"{ligand_name}_out.pdbqt")
                 shutil.copy(pdbqt_file, dest)
                 abs_dest = os.path.abspath(dest)
@@ -15,6 +15,8 @@ import yaml
 import requests
 import shutil
 import datetime
+import numpy as np
+from make_vina_box_from_residues import fixed_width_records, record_columns, column_field, to_float
 
 print(f"🧬 Using Python from: {sys.executable}")
 
@@ -23,12 +25,42 @@ print(f"🧬 Using Python from: {sys.executable}")
 def run_cmd(command, desc):
     print(f"\n🚀 {desc}...")
     try:
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run(command, check=True)
         print(f"✅ Done: {desc}")
     except subprocess.CalledProcessError as e:
         print(f"❌ Error during: {desc}\n{e}")
         sys.exit(1)
 
+def recenter_ligand(lig_path, center):
+    """Translate a ligand PDBQT in place so its atom centroid sits on `center`."""
+    with open(lig_path, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+    if not lines:
+        return
+
+    # Fixed-width records: view every line as a row of single-byte columns
+    recs = fixed_width_records(lines)
+    atom_idx = np.flatnonzero(np.char.startswith(recs, b"ATOM") | np.char.startswith(recs, b"HETATM"))
+    if not atom_idx.size:
+        return
+    width = recs.dtype.itemsize
+    cols = record_columns(recs[atom_idx])
+
+    xyz = to_float(column_field(cols, 30, 54, width=8))
+    valid = ~np.isnan(xyz).any(axis=1)
+    if not valid.any():
+        return
+
+    shifted = xyz[valid] + (np.asarray(center) - xyz[valid].mean(axis=0))
+    coords = np.char.mod(b"%8.3f", shifted).astype("S8")
+    cols[valid, 30:54] = np.ascontiguousarray(coords).view("S1").reshape(-1, 24)
+
+    for i, rec in zip(atom_idx[valid], cols[valid].view(f"S{width}").ravel().tolist()):
+        lines[i] = rec
+
+    with open(lig_path, "wb") as f:
+        f.writelines(lines)
+
 # ---------------- Step 0: Receptor prep ---------------- #
 
 def prepare_receptor(pdb_id, chains=None, keep_cofactors=False):
@@ -55,46 +87,47 @@ def prepare_receptor(pdb_id, chains=None, keep_cofactors=False):
     clean_file = f"{pdb_id}_clean.pdb"
     print(f"🧹 Cleaning {pdb_file} → {clean_file}")
 
-    with open(pdb_file) as f:
-        lines = f.readlines()
-
-    keep_chains = set(chains.split(",")) if chains else None
-    cleaned = []
-    for line in lines:
-        if not line.startswith(("ATOM", "HETATM")):
-            continue
-
-        resname = line[17:20].strip()
-        chain = line[21].strip()
-
-        # Skip solvent
-        if resname in {"HOH", "WAT", "SOL"}:
-            continue
-        # Skip cofactors unless requested
-        if not keep_cofactors and line.startswith("HETATM"):
-            continue
-        # Keep selected chains only
-        if keep_chains and chain not in keep_chains:
-            continue
-        # Keep only main conformation
-        alt = line[16].strip()
-        if alt not in ("", "A"):
-            continue
-        # Normalize MSE -> MET
-        if resname == "MSE":
-            line = line[:17] + "MET" + line[20:]
-        cleaned.append(line)
-
-    with open(clean_file, "w") as f:
+    with open(pdb_file, "rb") as f:
+        lines = f.read().splitlines(keepends=True)
+
+    # One vectorized pass over the fixed-width records instead of a
+    # per-line loop: every line becomes a row of single-byte columns.
+    recs = fixed_width_records(lines)
+    width = recs.dtype.itemsize
+    cols = record_columns(recs)
+
+    is_atom = np.char.startswith(recs, b"ATOM")
+    is_hetatm = np.char.startswith(recs, b"HETATM")
+    resname = np.char.strip(column_field(cols, 17, 20).ravel())
+    chain = np.char.strip(cols[:, 21])
+    alt = np.char.strip(cols[:, 16])
+
+    keep = is_atom | is_hetatm
+    # Skip solvent
+    keep &= ~np.isin(resname, [b"HOH", b"WAT", b"SOL"])
+    # Skip cofactors unless requested
+    if not keep_cofactors:
+        keep &= ~is_hetatm
+    # Keep selected chains only
+    if chains:
+        keep &= np.isin(chain, [c.encode() for c in chains.split(",")])
+    # Keep only main conformation
+    keep &= np.isin(alt, [b"", b"A"])
+    # Normalize MSE -> MET
+    cols[keep & (resname == b"MSE"), 17:20] = [b"M", b"E", b"T"]
+
+    cleaned = cols[keep].view(f"S{width}").ravel().tolist()
+
+    with open(clean_file, "wb") as f:
         f.writelines(cleaned)
-        f.write("END\n")
+        f.write(b"END\n")
     print(f"✅ Cleaned receptor saved: {clean_file}")
 
     # Add hydrogens and charges
     prepped_file = f"{pdb_id}_prepped.pdbqt"
     print(f"🔄 Adding hydrogens and charges via Open Babel...")
-    cmd = f"obabel {clean_file} -O {prepped_file} -xh -p 7.4 --partialcharge gasteiger"
-    subprocess.run(cmd, shell=True, check=True)
+    cmd = ["obabel", clean_file, "-O", prepped_file, "-xh", "-p", "7.4", "--partialcharge", "gasteiger"]
+    subprocess.run(cmd, check=True)
     print(f"✅ Receptor prepared: {prepped_file}")
 
     # --- Cleanup: remove ligand-style torsion tags ---
@@ -156,7 +189,6 @@ def main():
     # ✅ Define helper script paths (absolute)
     base_dir = os.path.dirname(os.path.abspath(__file__))
     add_ligands_script = os.path.join(base_dir, "add_ligands.py")
-    convert_script = os.path.join(base_dir, "convert_to_pdbqt.py")
     box_script = os.path.join(base_dir, "make_vina_box_from_residues.py")
     vina_script = os.path.join(base_dir, "run_vina_batch.py")
     summary_script = os.path.join(base_dir, "summarize_vina_scores.py")
@@ -166,12 +198,12 @@ def main():
     chains = cfg.get("chains", "")
     keep_cofactors = cfg.get("keep_cofactors", False)
     ligand_dir = cfg["ligand_dir"]
-    combined_sdf = cfg["combined_sdf"]
     residues = cfg["residues"]
     padding = cfg["padding"]
     config_out = cfg["config_out"]
-    cpu = cfg.get("cpu", 8)
+    cpu = cfg.get("cpu", 4)
     top_ligands = cfg.get("top_ligands", 5)
+    ligand_cache = cfg.get("ligand_cache", True)
 
     # Ensure directories exist
     for d in [ligand_dir, pdbqt_dir, results_dir]:
@@ -184,22 +216,19 @@ def main():
     else:
         receptor = prepare_receptor(pdb_id, chains, keep_cofactors)
 
-    # Step 1: Combine ligands
-    ligand_files_list = [
-        os.path.join(ligand_dir, f)
-        for f in os.listdir(ligand_dir)
-        if f.endswith((".sdf", ".mol", ".mol2"))
-    ]
-    ligand_files = " ".join(ligand_files_list)
-    cmd1 = f"python3 {add_ligands_script} {combined_sdf} {ligand_files}"
-    run_cmd(cmd1, "Combining ligand files")
-
-    # Step 2: Convert ligands to PDBQT
-    cmd2 = f"python3 {convert_script} {combined_sdf} {pdbqt_dir}"
-    run_cmd(cmd2, "Converting ligands to PDBQT")
+    # Steps 1-2: Prepare ligands and convert them straight to PDBQT
+    with os.scandir(ligand_dir) as it:
+        ligand_files_list = [
+            e.path for e in it
+            if e.is_file() and e.name.endswith((".sdf", ".mol", ".mol2"))
+        ]
+    cmd1 = ["python3", add_ligands_script, "--pdbqt", pdbqt_dir, *ligand_files_list]
+    if not ligand_cache:
+        cmd1.insert(2, "--no-cache")
+    run_cmd(cmd1, "Preparing ligands and converting to PDBQT")
 
     # Step 3: Create docking box
-    cmd3 = f"python3 {box_script} {receptor} \"{residues}\" --padding {padding} --out {config_out}"
+    cmd3 = ["python3", box_script, receptor, residues, "--padding", str(padding), "--out", config_out]
     run_cmd(cmd3, "Generating vina_config.txt")
 
     # Step 4: Recenter ligands
@@ -219,54 +248,20 @@ def main():
     if None in (center_x, center_y, center_z):
         print("⚠️  Could not read box center; skipping ligand recentering.")
     else:
-        for lig in os.listdir(pdbqt_dir):
-            if not lig.endswith(".pdbqt"):
-                continue
-            lig_path = os.path.join(pdbqt_dir, lig)
-            with open(lig_path) as f:
-                lines = f.readlines()
-
-            xs, ys, zs = [], [], []
-            for ln in lines:
-                if ln.startswith(("ATOM", "HETATM")):
-                    try:
-                        xs.append(float(ln[30:38]))
-                        ys.append(float(ln[38:46]))
-                        zs.append(float(ln[46:54]))
-                    except ValueError:
-                        pass
-
-            if not xs:
-                continue
-
-            cx0 = sum(xs) / len(xs)
-            cy0 = sum(ys) / len(ys)
-            cz0 = sum(zs) / len(zs)
-            dx, dy, dz = center_x - cx0, center_y - cy0, center_z - cz0
-
-            out = []
-            for ln in lines:
-                if ln.startswith(("ATOM", "HETATM")):
-                    try:
-                        x = float(ln[30:38]) + dx
-                        y = float(ln[38:46]) + dy
-                        z = float(ln[46:54]) + dz
-                        ln = f"{ln[:30]}{x:8.3f}{y:8.3f}{z:8.3f}{ln[54:]}"
-                    except ValueError:
-                        pass
-                out.append(ln)
-
-            with open(lig_path, "w") as f:
-                f.writelines(out)
+        center = (center_x, center_y, center_z)
+        with os.scandir(pdbqt_dir) as it:
+            for e in it:
+                if e.is_file() and e.name.endswith(".pdbqt"):
+                    recenter_ligand(e.path, center)
 
         print("✅ Ligands recentered to box center.")
 
     # Step 5: Run docking
-    cmd4 = f"python3 run_vina_batch.py {receptor} {pdbqt_dir} {results_dir} {config_out} --cpu {cpu}"
-    run_cmd(cmd4, f"Running AutoDock Vina batch docking with {cpu} CPUs")
+    cmd4 = ["python3", vina_script, receptor, pdbqt_dir, results_dir, config_out, "--cpu", str(cpu)]
+    run_cmd(cmd4, f"Running AutoDock Vina batch docking with {cpu} CPUs per ligand")
 
     # Step 6: Summarize results
-    cmd5 = f"python3 {summary_script} {results_dir}"
+    cmd5 = ["python3", summary_script, results_dir]
     run_cmd(cmd5, "Summarizing docking results")
 
     print("\n🎉 Pipeline completed successfully!")
@@ -274,7 +269,7 @@ def main():
     
     # Step 7: Prepare top ligands for ChimeraX visualization
     prepare_top_script = os.path.join(base_dir, "prepare_top_ligands_for_chimerax.py")
-    cmd6 = f"python3 {prepare_top_script} {receptor} {results_dir} {top_ligands}"
+    cmd6 = ["python3", prepare_top_script, receptor, results_dir, str(top_ligands)]
     run_cmd(cmd6, f"Preparing top {top_ligands} ligands for ChimeraX")
 
 
@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 import os, sys, subprocess, argparse
+import concurrent.futures
+from tqdm import tqdm
 
 def parse_args():
     p = argparse.ArgumentParser(
@@ -9,9 +11,23 @@ def parse_args():
     p.add_argument("ligands_dir", help="Directory containing ligand .pdbqt files")
     p.add_argument("results_dir", help="Output directory for docked poses")
     p.add_argument("config", help="Vina config file (e.g., vina_config.txt)")
-    p.add_argument("--cpu", type=int, default=8, help="Number of CPU cores for Vina (default: 8)")
+    p.add_argument("--cpu", type=int, default=4, help="CPU threads per Vina run; several runs go in parallel. 0 = one run at a time, Vina auto-detects (default: 4)")
     return p.parse_args()
 
+def estimate_cost(lig_path):
+    """Rough docking cost of a ligand PDBQT as (torsions, atom count)."""
+    with open(lig_path, "rb") as f:
+        data = f.read()
+    n_atoms = data.count(b"\nATOM") + data.count(b"\nHETATM") + data.startswith((b"ATOM", b"HETATM"))
+    torsdof = 0
+    idx = data.rfind(b"TORSDOF")
+    if idx >= 0:
+        try:
+            torsdof = int(data[idx + len(b"TORSDOF"):].split()[0])
+        except (ValueError, IndexError):
+            pass
+    return torsdof, n_atoms
+
 def fail(msg, code=2):
     print(f"❌ {msg}")
     sys.exit(code)
@@ -26,17 +42,21 @@ def main():
         fail(f"Vina config not found: {args.config}")
     if not os.path.isdir(args.ligands_dir):
         fail(f"Ligands directory not found: {args.ligands_dir}")
+    if args.cpu < 0:
+        fail(f"--cpu must be 0 (auto-detect) or a positive thread count, got {args.cpu}")
 
-    ligands = [f for f in os.listdir(args.ligands_dir) if f.endswith(".pdbqt")]
-    ligands.sort()
+    with os.scandir(args.ligands_dir) as it:
+        ligands = sorted(e.name for e in it if e.is_file() and e.name.endswith(".pdbqt"))
     if not ligands:
         fail(f"No .pdbqt ligands found in {args.ligands_dir}")
 
+    # Start the most expensive ligands first so the run doesn't end with
+    # one large ligand docking alone while the other workers sit idle
+    ligands.sort(key=lambda lig: estimate_cost(os.path.join(args.ligands_dir, lig)), reverse=True)
+
     os.makedirs(args.results_dir, exist_ok=True)
 
-    total = len(ligands)
-    completed = 0
-    for i, lig in enumerate(ligands, 1):
+    def dock(lig):
         lig_path = os.path.join(args.ligands_dir, lig)
         out_name = os.path.splitext(lig)[0] + "_out.pdbqt"
         out_path = os.path.join(args.results_dir, out_name)
@@ -49,14 +69,31 @@ def main():
             "--out", out_path,
             "--cpu", str(args.cpu),
         ]
+        # Vina's banner/progress output is discarded; stderr is kept for errors
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
 
-        try:
-            subprocess.run(cmd, check=True)
-            completed += 1
-        except subprocess.CalledProcessError as e:
-            print(f"⚠️  Vina failed for {lig}: {e}")
+    # Vina's own threading plateaus after a few cores, so dock several
+    # ligands at once with args.cpu threads each. With --cpu 0 Vina picks its
+    # own thread count, so run a single job at a time.
+    if args.cpu == 0:
+        workers = 1
+        print("🧵 Docking 1 ligand at a time; Vina auto-detects CPUs")
+    else:
+        workers = max(1, (os.cpu_count() or 1) // args.cpu)
+        print(f"🧵 Docking {workers} ligand(s) at a time with {args.cpu} CPU(s) each")
 
-        print(f"⏱️  Completed {i}/{total} ligands")
+    total = len(ligands)
+    completed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = {ex.submit(dock, lig): lig for lig in ligands}
+        done = concurrent.futures.as_completed(futures)
+        for fut in tqdm(done, total=total, desc="⏱️  Docking", unit="ligand"):
+            lig = futures[fut]
+            try:
+                fut.result()
+                completed += 1
+            except subprocess.CalledProcessError as e:
+                tqdm.write(f"⚠️  Vina failed for {lig}: {e}\n{e.stderr}")
 
     print(f"\n✅ Docking completed for {completed}/{total} ligands.")
     print(f"✅ Results stored in: {args.results_dir}")
@@ -1,20 +1,29 @@
 #!/usr/bin/env python3
 import os
 import csv
+import concurrent.futures
 import re
 import subprocess
 import sys
 
+# Bytes read from the top of each Vina output file when looking for the score
+HEADER_BYTES = 1024
+
 def parse_vina_output(pdbqt_path):
     """Extract the best binding energy (kcal/mol) from a Vina .pdbqt file."""
     try:
-        with open(pdbqt_path, "r") as f:
-            for line in f:
-                if "REMARK VINA RESULT" in line:
-                    parts = line.split()
-                    # Example: ['REMARK', 'VINA', 'RESULT:', '-5.830', '0.000', '0.000']
-                    if len(parts) >= 4:
-                        return float(parts[3])
+        with open(pdbqt_path, "rb") as f:
+            # Vina writes the result remark right after "MODEL 1", so the
+            # header window is all that needs to be read
+            head = f.read(HEADER_BYTES)
+        idx = head.find(b"REMARK VINA RESULT")
+        if idx < 0:
+            return None
+        end = head.find(b"\n", idx)
+        parts = head[idx:end if end >= 0 else len(head)].split()
+        # Example: [b'REMARK', b'VINA', b'RESULT:', b'-5.830', b'0.000', b'0.000']
+        if len(parts) >= 4:
+            return float(parts[3])
     except Exception:
         return None
     return None
@@ -22,13 +31,17 @@ def parse_vina_output(pdbqt_path):
 def main(results_dir):
     scores = []
 
-    for file in os.listdir(results_dir):
-        if file.endswith("_out.pdbqt"):
-            ligand_name = file.replace("_out.pdbqt", "")
-            pdbqt_path = os.path.join(results_dir, file)
-            score = parse_vina_output(pdbqt_path)
-            if score is not None:
-                scores.append((ligand_name, score))
+    with os.scandir(results_dir) as it:
+        entries = [e for e in it if e.is_file() and e.name.endswith("_out.pdbqt")]
+    out_files = [e.name for e in entries]
+    paths = [e.path for e in entries]
+    with concurrent.futures.ThreadPoolExecutor() as ex:
+        results = list(ex.map(parse_vina_output, paths))
+
+    for file, score in zip(out_files, results):
+        ligand_name = file.replace("_out.pdbqt", "")
+        if score is not None:
+            scores.append((ligand_name, score))
 
     if not scores:
         print("⚠️  No valid docking result files or scores found.")